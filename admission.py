@@ -0,0 +1,168 @@
+from collections import defaultdict
+from functools import wraps
+from threading import Lock
+from time import monotonic
+
+from telegram.error import BadRequest
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRUNE_PERIOD = 1000  # admission checks between two prunings of the idle buckets
+
+
+class TokenBucket:
+    '''Allows burst requests at once, then rate requests per second.'''
+
+    def __init__(self, rate, burst, now):
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        '''Adds the tokens earned since the last refill.'''
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self, now):
+        '''Checks whether the bucket would be full, idle full buckets can be dropped.'''
+
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+def create_rejection(scope, owner_id, send_notice):
+    '''Returns the callback that answers a shed update, with the throttling notice if it is due.'''
+
+    def reject(update, context):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+
+        if update.callback_query:
+
+            try:
+                update.callback_query.answer('Too many requests, try again later')
+
+            except BadRequest as error:  # e.g. the query is too old
+                logger.debug('Shed button press not answered: %s', error, extra={'chat_id': chat_id})
+
+        if send_notice and chat_id is not None:
+            logger.warning('Commands of %s %s are being throttled', scope, owner_id, extra={'chat_id': chat_id})
+            who = 'You are' if scope == 'user' else 'This chat is'
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=f'{who} sending too many commands, some of them will be ignored for a while'
+            )
+
+    return reject
+
+
+class AdmissionControl:
+    '''Sheds commands of users and chats exceeding their budget, before they reach the handlers.
+
+    Each user and each chat have a token bucket for reads and one for writes.
+    Shed commands are dropped without replying, except for one notice per
+    notice_window seconds to the offending user or chat. Shed button presses
+    are still answered, so that the client stops its spinner. Both go through
+    the chat executor, the dispatcher thread never calls the API.
+    '''
+
+    def __init__(self, budgets, notice_window, executor):
+
+        self.budgets = budgets  # kind -> scope -> {'rate', 'burst'}
+        self.notice_window = notice_window
+        self.executor = executor
+        self._buckets = {}  # (scope, id, kind) -> TokenBucket
+        self._notices = {}  # (scope, id) -> time of the last notice
+        self._lock = Lock()
+        self._checks = 0
+        self.admitted = 0
+        self.shed = defaultdict(int)  # f'{scope}_{kind}' -> shed commands
+
+    def wrap(self, callback, kind):
+        '''Returns a handler callback that runs the original one only if the command is admitted.'''
+
+        @wraps(callback)
+        def admit_callback(update, context):
+            if self.admit(update, context, kind):
+                callback(update, context)
+
+        return admit_callback
+
+    def admit(self, update, context, kind):
+        '''Takes a token from the user and chat buckets, returns False if one of them is empty.'''
+
+        user_id = update.effective_user.id if update.effective_user else None
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        now = monotonic()
+
+        with self._lock:
+            buckets = {
+                'user': self.get_bucket('user', user_id, kind, now),
+                'chat': self.get_bucket('chat', chat_id, kind, now)
+            }
+
+            for bucket in buckets.values():
+                bucket.refill(now)
+
+            empty = [scope for scope, bucket in buckets.items() if bucket.tokens < 1]
+
+            if not empty:
+
+                for bucket in buckets.values():
+                    bucket.tokens -= 1
+
+                self.admitted += 1
+                self.prune(now)
+                return True
+
+            scope = empty[0]
+            self.shed[f'{scope}_{kind}'] += 1
+            notice_key = (scope, user_id if scope == 'user' else chat_id)
+            send_notice = now - self._notices.get(notice_key, -self.notice_window) >= self.notice_window
+
+            if send_notice:
+                self._notices[notice_key] = now
+
+        if update.callback_query or (send_notice and chat_id is not None):
+            self.executor.submit(create_rejection(scope, notice_key[1], send_notice), update, context)
+
+        return False
+
+    def get_bucket(self, scope, owner_id, kind, now):
+        '''Returns the bucket of a user or chat, a full one if it is new.'''
+
+        key = (scope, owner_id, kind)
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            budget = self.budgets[kind][scope]
+            bucket = self._buckets[key] = TokenBucket(budget['rate'], budget['burst'], now)
+
+        return bucket
+
+    def prune(self, now):
+        '''Drops the buckets that have been refilled completely, they are recreated full when needed.'''
+
+        self._checks += 1
+
+        if self._checks % PRUNE_PERIOD:
+            return
+
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
+
+        for key in [key for key, time in self._notices.items() if now - time >= self.notice_window]:
+            del self._notices[key]
+
+    def metrics(self):
+        '''Returns admitted and shed commands and the number of active buckets.'''
+
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+                'buckets': len(self._buckets)
+            }
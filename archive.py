@@ -0,0 +1,198 @@
+from threading import Lock
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from db_manager import SPORT_TYPES, get_sport_type_info
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIRECTORY = CONFIG['archive']['directory']
+SPORTS_FILE = os.path.join(ARCHIVE_DIRECTORY, 'sports.json')
+
+# one append-only binary file per column, one row per finished match
+COLUMNS = {
+    'chat_id': np.int64,
+    'sport': np.uint8,  # index in the sports.json list
+    'epoch': np.int64,  # UTC timestamp of the beginning of the match
+    'utc_offset': np.int32,  # seconds, to recover the local weekday and hour
+    'duration': np.int32,  # minutes
+    'player_offset': np.int64,  # position of the first player in the players column
+    'player_count': np.uint16
+}
+PLAYERS_COLUMN = ('players', np.int64)
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+SECONDS_PER_DAY = 86400
+
+_lock = Lock()
+
+
+def get_column_path(name):
+    '''Returns the path of the file of a column.'''
+
+    return os.path.join(ARCHIVE_DIRECTORY, f'{name}.bin')
+
+
+def load_column(name, dtype):
+    '''Maps a column file in memory, missing columns are empty and a partially written last value is ignored.'''
+
+    path = get_column_path(name)
+    length = os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+
+    if not length:
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+
+def load_sports():
+    '''Returns the sports archived so far, their position is the code stored in the sport column.'''
+
+    if not os.path.exists(SPORTS_FILE):
+        return []
+
+    with open(SPORTS_FILE, 'r') as file:
+        return json.loads(file.read())
+
+
+def append_to_column(name, dtype, values):
+    '''Appends values at the end of a column file.'''
+
+    with open(get_column_path(name), 'ab') as column:
+        np.asarray(values, dtype=dtype).tofile(column)
+
+
+def truncate_columns():
+    '''Cuts the columns after the last complete row, returns the length of the players column.
+
+    An interrupted append leaves some columns longer than others, every
+    following row would be misaligned if they were not cut first.
+    '''
+
+    columns = {name: load_column(name, dtype) for name, dtype in COLUMNS.items()}
+    rows = min(len(column) for column in columns.values())
+    players_end = int(columns['player_offset'][rows - 1] + columns['player_count'][rows - 1]) if rows else 0
+    del columns  # the maps must not outlive the truncation
+
+    lengths = {name: (dtype, rows) for name, dtype in COLUMNS.items()}
+    lengths[PLAYERS_COLUMN[0]] = (PLAYERS_COLUMN[1], players_end)
+
+    for name, (dtype, length) in lengths.items():
+        path = get_column_path(name)
+        size = length * np.dtype(dtype).itemsize
+
+        if os.path.exists(path) and os.path.getsize(path) != size:
+            logger.warning('Archive column %s cut to %d values after an interrupted append', name, length)
+            os.truncate(path, size)
+
+    return players_end
+
+
+def archive_match(match):
+    '''Appends a finished match to the archive.'''
+
+    players = [int(player) for player in match.players_list if player]
+    duration = match.duration.hour * 60 + match.duration.minute
+
+    with _lock:
+        os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+        sports = load_sports()
+
+        if match.sport not in sports:
+            sports.append(match.sport)
+
+            with open(SPORTS_FILE, 'w') as file:
+                file.write(json.dumps(sports))
+
+        player_offset = truncate_columns()
+        append_to_column(*PLAYERS_COLUMN, players)
+
+        row = {
+            'chat_id': int(match.chat_id),
+            'sport': sports.index(match.sport),
+            'epoch': int(match.datetime.timestamp()),
+            'utc_offset': int(match.datetime.utcoffset().total_seconds()),
+            'duration': duration,
+            'player_offset': player_offset,
+            'player_count': len(players)
+        }
+
+        for name, dtype in COLUMNS.items():
+            append_to_column(name, dtype, [row[name]])
+
+    logger.info('Match %s archived', match.match_id, extra={'chat_id': match.chat_id, 'match_id': match.match_id})
+
+
+def load_archive():
+    '''Loads all the columns, rows of an interrupted append are discarded.
+
+    The columns are copied out of their memory maps while holding the lock,
+    as archive_match may truncate the files once it is released.
+    '''
+
+    with _lock:
+        columns = {name: load_column(name, dtype) for name, dtype in COLUMNS.items()}
+        rows = min(len(column) for column in columns.values())
+        columns = {name: np.array(column[:rows]) for name, column in columns.items()}
+        players = np.array(load_column(*PLAYERS_COLUMN))
+        sports = load_sports()
+
+    return columns, players, sports
+
+
+def compute_stats(chat_id, top=3):
+    '''Computes the aggregates of the finished matches of a chat, None if there are none.'''
+
+    columns, players, sports = load_archive()
+    in_chat = columns['chat_id'] == int(chat_id)
+    games = int(in_chat.sum())
+
+    if not games:
+        return None
+
+    sport = columns['sport'][in_chat]
+    player_count = columns['player_count'][in_chat].astype(np.int64)
+    player_offset = columns['player_offset'][in_chat]
+    local_time = columns['epoch'][in_chat] + columns['utc_offset'][in_chat]
+
+    games_per_sport = np.bincount(sport, minlength=len(sports))
+    weekdays = np.bincount((local_time // SECONDS_PER_DAY + 3) % 7, minlength=7)  # 01/01/1970 was a Thursday
+    hours = np.bincount((local_time % SECONDS_PER_DAY) // 3600, minlength=24)
+
+    # positions of the players of the selected matches in the players column
+    starts = np.repeat(player_offset - np.cumsum(player_count) + player_count, player_count)
+    chat_players = players[starts + np.arange(player_count.sum())]
+    player_ids, appearances = np.unique(chat_players, return_counts=True)
+    most_active = np.argsort(appearances, kind='stable')[::-1][:top]
+
+    required = np.array(
+        [get_sport_type_info(name)[0] if name in SPORT_TYPES else np.nan for name in sports],
+        dtype=np.float64
+    )
+    fill_rate = player_count / required[sport]
+    known_sports = ~np.isnan(fill_rate)  # sports removed from sport_config.json have no required players
+
+    return {
+        'games': games,
+        'games_per_sport': {
+            sports[code]: int(count) for code, count in enumerate(games_per_sport) if count
+        },
+        'most_active_players': [
+            (str(player_ids[index]), int(appearances[index])) for index in most_active
+        ],
+        'busiest_weekdays': get_busiest(weekdays, WEEKDAYS, top),
+        'busiest_hours': get_busiest(hours, [f'{hour:02d}:00' for hour in range(24)], top),
+        'fill_rate': float(fill_rate[known_sports].mean()) if known_sports.any() else None
+    }
+
+
+def get_busiest(counts, labels, top):
+    '''Returns the labels of the highest non zero counts.'''
+
+    order = np.argsort(counts, kind='stable')[::-1][:top]
+
+    return [(labels[index], int(counts[index])) for index in order if counts[index]]
@@ -0,0 +1,99 @@
+from threading import Lock
+
+MATCH_VERSIONS = {}  # match_id -> number of writes to the match
+CHAT_VERSIONS = {}  # chat_id -> number of writes to the matches of the chat
+INFO_CACHE = {}  # match_id -> (version, players shown, rendered info message)
+LIST_CACHE = {}  # chat_id -> (version, players shown, rendered match list)
+
+_lock = Lock()
+
+
+def get_match_version(match_id):
+    '''Returns the current version of a match.'''
+
+    return MATCH_VERSIONS.get(str(match_id), 0)
+
+
+def get_match_versions():
+    '''Returns a snapshot of the versions of all the matches.'''
+
+    with _lock:
+        return MATCH_VERSIONS.copy()
+
+
+def get_chat_version(chat_id):
+    '''Returns the current version of the matches of a chat.'''
+
+    return CHAT_VERSIONS.get(str(chat_id), 0)
+
+
+def get_cached_info(match_id, version):
+    '''Returns the rendered info message of a match if it was rendered from the given, current, version.'''
+
+    match_id = str(match_id)
+
+    with _lock:
+        cached = INFO_CACHE.get(match_id)
+
+        if cached and cached[0] == version == MATCH_VERSIONS.get(match_id, 0):
+            return cached[2]
+
+    return None
+
+
+def cache_info(match_id, version, players, text):
+    '''Stores the rendered info message of a match showing the given players, stale versions are discarded.'''
+
+    match_id = str(match_id)
+
+    with _lock:
+        if version == MATCH_VERSIONS.get(match_id, 0):
+            INFO_CACHE[match_id] = (version, frozenset(players), text)
+
+
+def get_cached_list(chat_id):
+    '''Returns the rendered match list of a chat, None if it has to be rebuilt.'''
+
+    chat_id = str(chat_id)
+
+    with _lock:
+        cached = LIST_CACHE.get(chat_id)
+
+        if cached and cached[0] == CHAT_VERSIONS.get(chat_id, 0):
+            return cached[2]
+
+    return None
+
+
+def cache_list(chat_id, version, players, text):
+    '''Stores the rendered match list of a chat showing the given players, stale versions are discarded.'''
+
+    chat_id = str(chat_id)
+
+    with _lock:
+        if version == CHAT_VERSIONS.get(chat_id, 0):
+            LIST_CACHE[chat_id] = (version, frozenset(players), text)
+
+
+def invalidate(match_id, chat_id):
+    '''Drops the rendered messages depending on a match, to be called on every database write.'''
+
+    match_id = str(match_id)
+    chat_id = str(chat_id)
+
+    with _lock:
+        MATCH_VERSIONS[match_id] = MATCH_VERSIONS.get(match_id, 0) + 1
+        CHAT_VERSIONS[chat_id] = CHAT_VERSIONS.get(chat_id, 0) + 1
+        INFO_CACHE.pop(match_id, None)
+        LIST_CACHE.pop(chat_id, None)
+
+
+def invalidate_player(user_id):
+    '''Drops the rendered messages showing a player, to be called when the name shown for them changes.'''
+
+    user_id = str(user_id)
+
+    with _lock:
+        for cache in (INFO_CACHE, LIST_CACHE):
+            for key in [key for key, (_, players, __) in cache.items() if user_id in players]:
+                del cache[key]
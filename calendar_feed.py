@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from pytz import utc
+
+import hashlib
+import hmac
+import logging
+import re
+import secrets
+
+from cache import get_chat_version, get_match_versions
+from db_manager import get_matches_from_chat
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_CONFIG = CONFIG['calendar']
+FEED_PATH = re.compile(r'^/calendar/(-?\d+)/([0-9a-f]+)\.ics$')
+ICS_TIME_FORMAT = '%Y%m%dT%H%M%SZ'
+
+SECRET = CALENDAR_CONFIG['secret'].encode() or secrets.token_bytes(32)
+
+
+def get_feed_token(chat_id):
+    '''Returns the secret token that grants access to the feed of a chat.'''
+
+    return hmac.new(SECRET, str(chat_id).encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def get_feed_url(chat_id):
+    '''Returns the URL of the calendar feed of a chat.'''
+
+    return f'{CALENDAR_CONFIG["public_url"]}/calendar/{chat_id}/{get_feed_token(chat_id)}.ics'
+
+
+def escape_text(text):
+    '''Escapes a value of an iCalendar text property.'''
+
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def create_vevent(match):
+    '''Produces the VEVENT of a match.'''
+
+    start = match.datetime.astimezone(utc)
+    end = start + timedelta(hours=match.duration.hour, minutes=match.duration.minute)
+    missing_players = match.get_missing_players_number()
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:match-{match.match_id}@sport_scheduler_bot',
+        f'DTSTAMP:{datetime.now(utc).strftime(ICS_TIME_FORMAT)}',
+        f'DTSTART:{start.strftime(ICS_TIME_FORMAT)}',
+        f'DTEND:{end.strftime(ICS_TIME_FORMAT)}',
+        f'SUMMARY:{escape_text(f"{match.sport} match {match.match_id}")}',
+        f'DESCRIPTION:{escape_text(f"Missing players: {missing_players}")}',
+        'END:VEVENT'
+    ]
+
+    return '\r\n'.join(lines)
+
+
+class CalendarFeed:
+    '''Builds the iCalendar feeds of the chats.
+
+    The VEVENT of each match is kept until the match changes, the whole feed and
+    its ETag until a match of the chat changes, so polling an unchanged feed
+    does not even read the database.
+    '''
+
+    def __init__(self):
+
+        self._events = {}  # chat_id -> {match_id: (version, VEVENT)}
+        self._feeds = {}  # chat_id -> (chat version, body, etag)
+        self._lock = Lock()
+
+    def get_feed(self, chat_id):
+        '''Returns body and ETag of the feed of a chat.'''
+
+        chat_id = str(chat_id)
+        version = get_chat_version(chat_id)
+
+        with self._lock:
+            cached = self._feeds.get(chat_id)
+
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+        match_versions = get_match_versions()
+
+        try:
+            matches = get_matches_from_chat(chat_id)
+
+        except FileNotFoundError:
+            matches = ()
+
+        with self._lock:
+            old_events = self._events.get(chat_id, {})
+            events = {}
+
+            for match in matches:
+                match_version = match_versions.get(match.match_id, 0)
+                cached_event = old_events.get(match.match_id)
+
+                if cached_event and cached_event[0] == match_version:
+                    events[match.match_id] = cached_event
+
+                else:
+                    events[match.match_id] = (match_version, create_vevent(match))
+
+            body = '\r\n'.join([
+                'BEGIN:VCALENDAR',
+                'VERSION:2.0',
+                'PRODID:-//sport_scheduler_bot//EN',
+                'X-WR-CALNAME:Matches',
+                *(event for _, event in events.values()),
+                'END:VCALENDAR',
+                ''
+            ]).encode()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            self._events[chat_id] = events
+            self._feeds[chat_id] = (version, body, etag)
+
+        logger.debug('Calendar feed of chat %s regenerated', chat_id, extra={'chat_id': chat_id})
+
+        return body, etag
+
+
+CALENDAR_FEED = CalendarFeed()
+
+
+class CalendarRequestHandler(BaseHTTPRequestHandler):
+    '''Serves the feeds at /calendar/<chat_id>/<token>.ics'''
+
+    def do_GET(self):
+
+        path = FEED_PATH.match(self.path.split('?')[0])
+
+        if not path or not hmac.compare_digest(path.group(2), get_feed_token(path.group(1))):
+            self.send_error(404)
+            return
+
+        body, etag = CALENDAR_FEED.get_feed(path.group(1))
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_calendar_server():
+    '''Serves the calendar feeds in a background thread.'''
+
+    if not CALENDAR_CONFIG['secret']:
+        logger.warning('No calendar secret in config.json, feed URLs will change when the bot restarts')
+
+    server = ThreadingHTTPServer((CALENDAR_CONFIG['host'], CALENDAR_CONFIG['port']), CalendarRequestHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name='calendar_server', daemon=True).start()
+    logger.info('Calendar feeds served on %s:%s', CALENDAR_CONFIG['host'], CALENDAR_CONFIG['port'])
+
+    return server
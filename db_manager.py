@@ -1,10 +1,19 @@
 from dataclasses import dataclass, field
 from datetime import datetime, date, time
 from pytz import timezone
+from threading import RLock
 
 import logging
 
-from config import CONFIG, SPORT_CONFIG
+from cache import (
+    invalidate,
+    get_match_version,
+    get_match_versions,
+    get_cached_info,
+    cache_info
+)
+from player_names import PLAYER_NAMES
+from config import SPORT_CONFIG
 
 
 SPORT_TYPES = SPORT_CONFIG['sport_types']
@@ -18,15 +27,19 @@ POSITIONS = {
     'first_player': 6
 }
 
-logging.basicConfig(format=CONFIG['logging']['format'], level=CONFIG['logging']['level'])
 logger = logging.getLogger(__name__)
 
+DB_LOCK = RLock()  # handlers of different chats run in parallel, file accesses must not interleave
+
 
 def find_match(match_id, modifying_user_chat_id=None):
     '''Searches the database for the given match.'''
 
-    with open('matches_db.csv', 'r') as db:
-        db_as_text = db.read()
+    with DB_LOCK:
+        version = get_match_version(match_id)
+
+        with open('matches_db.csv', 'r') as db:
+            db_as_text = db.read()
 
     db_as_list = db_as_text.split('\n')
 
@@ -49,6 +62,7 @@ def find_match(match_id, modifying_user_chat_id=None):
                 players_list=players_list
             )
             match.match_id = match_id
+            match.version = version
 
             return db_as_list, match, index
 
@@ -58,8 +72,11 @@ def find_match(match_id, modifying_user_chat_id=None):
 def get_matches_from_chat(chat_id):
     '''Returns all the matches created in the same chat.'''
 
-    with open('matches_db.csv', 'r') as db:
-        db_as_text = db.read()
+    with DB_LOCK:
+        versions = get_match_versions()
+
+        with open('matches_db.csv', 'r') as db:
+            db_as_text = db.read()
 
     db_as_list = db_as_text.split('\n')
 
@@ -80,6 +97,7 @@ def get_matches_from_chat(chat_id):
                 players_list=players_list
             )
             match.match_id = match_id
+            match.version = versions.get(match_id, 0)
             matches.append(match)
 
     matches = tuple(matches)
@@ -90,20 +108,50 @@ def get_matches_from_chat(chat_id):
 def overwrite_line(db_as_list, target_index, match=None):
     '''Overwrites a line of the database with the given new one.'''
 
-    if match:
+    values = db_as_list[target_index].split(',')
+    match_id, chat_id = values[POSITIONS['match_id']], values[POSITIONS['chat_id']]
+
+    with DB_LOCK:
+        # other chats may have written since db_as_list was read, so the line is looked up again
+        with open('matches_db.csv', 'r') as db:
+            db_as_list = db.read().split('\n')
+
+        target_index = get_line_index(db_as_list, match_id)
+
+        if target_index is None:
+            logger.warning('Match %s has already been removed from database', match_id, extra={'chat_id': chat_id, 'match_id': match_id})
+            return
+
+        if match:
+
+            newline = str(match)
+            db_as_list[target_index] = newline
+
+        else:  # when match is not specified it just deletes the line
+            db_as_list.pop(target_index)
 
-        newline = str(match)
-        db_as_list[target_index] = newline
+        updated_db = '\n'.join(db_as_list)
 
-    else:  # when match is not specified it just deletes the line
-        db_as_list.pop(target_index)
+        with open('matches_db.csv', 'w') as db:
+            db.write(updated_db)
 
-    updated_db = '\n'.join(db_as_list)
+        invalidate(match_id, chat_id)
 
-    with open('matches_db.csv', 'w') as db:
-        db.write(updated_db)
+        if match:  # the written match is now the current version
+            match.version = get_match_version(match_id)
 
-    logger.info('Database successfully updated')
+    logger.info('Database successfully updated', extra={'chat_id': chat_id, 'match_id': match_id})
+
+
+def get_line_index(db_as_list, match_id):
+    '''Returns the index of the line of the given match, None if it is missing.'''
+
+    for index, line in enumerate(db_as_list):
+
+        if line.split(',')[POSITIONS['match_id']] == str(match_id):
+            return index
+
+    return None
 
 
 def get_sport_type_info(sport):
@@ -140,14 +188,18 @@ def generate_key():
 def store_in_db(match):
     '''Stores new matches in the database.'''
 
-    match_id = generate_key()
-    match.match_id = match_id
-    line = f'{match}\n'
+    with DB_LOCK:  # two new matches must not get the same key
+        match_id = generate_key()
+        match.match_id = match_id
+        line = f'{match}\n'
+
+        with open('matches_db.csv', 'a') as db:
+            db.write(line)
 
-    with open('matches_db.csv', 'a') as db:
-        db.write(line)
+        invalidate(match_id, match.chat_id)
+        match.version = get_match_version(match_id)
 
-    logger.info(f'New match {match_id} added')
+    logger.info('New match %s added', match_id, extra={'chat_id': match.chat_id, 'match_id': match_id})
 
     return match_id
 
@@ -165,6 +217,7 @@ class Match:
     timezone: timezone = field(default=timezone('Europe/Rome'))
     match_id: str = field(init=False)
     datetime: datetime = field(init=False)
+    version: int = field(init=False, default=0)
 
     def __post_init__(self):
 
@@ -208,7 +261,10 @@ class Match:
 
         now = self.timezone.localize(datetime.now())
         time_left = self.datetime - now
-        logger.debug(f'Time left to event: {self.datetime} - {now} = {time_left}')
+        logger.debug(
+            'Time left to event: %s - %s = %s', self.datetime, now, time_left,
+            extra={'match_id': self.match_id, 'sample': 'event_time_check'}
+        )
 
         return time_left
 
@@ -228,7 +284,10 @@ class Match:
         now = self.timezone.localize(datetime.now())
 
         if self.datetime < now:
-            logger.debug(f'Event in the past check: {self.datetime} < {now}')
+            logger.debug(
+                'Event in the past check: %s < %s', self.datetime, now,
+                extra={'sample': 'event_time_check'}
+            )
             return True
 
         return False
@@ -246,9 +305,19 @@ class Match:
 
         return missing_players
 
+    def get_player_names(self):
+        '''Returns the names of the players, as known by the name cache.'''
+
+        return ', '.join(PLAYER_NAMES.get_names(self.players_list, self.chat_id))
+
     def create_info_message(self):
         '''Produces a readable message containing the info about the match.'''
 
+        cached = get_cached_info(self.match_id, self.version)
+
+        if cached is not None:
+            return cached
+
         event_date = self.date.strftime('%A %d/%m/%Y')
         event_time = self.time.strftime('%H:%M')
         event_duration = self.duration.strftime('%H:%M')
@@ -258,5 +327,10 @@ class Match:
         missing_players_info = f'Missing players: {missing_players}.'
         text = f'{infomessage}.\n{missing_players_info}'
 
+        if self.players_list:
+            text = f'{text}\nPlayers: {self.get_player_names()}.'
+
+        cache_info(self.match_id, self.version, self.players_list, text)
+
         return text
 
@@ -0,0 +1,153 @@
+from collections import defaultdict
+from functools import wraps
+from queue import Queue, Full
+from threading import Thread, Lock
+from time import monotonic
+
+from telegram.error import TelegramError
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def answer_dropped(callback_query, chat_id):
+    '''Answers a dropped button press.'''
+
+    try:
+        callback_query.answer('Too many requests, try again later')
+
+    except TelegramError as error:  # e.g. the query is too old
+        logger.debug('Dropped button press not answered: %s', error, extra={'chat_id': chat_id})
+
+
+class ChatExecutor:
+    '''Runs handlers on a pool of workers, updates of the same chat always go to the same worker.
+
+    Updates within a chat are processed in order while different chats run in parallel.
+    Submitting never blocks the dispatcher: an update is dropped at once when its
+    chat already has chat_queue_size updates waiting, or its worker worker_queue_size.
+    Dropped button presses are still answered, on the dispatcher's async pool,
+    so that the client stops its spinner.
+    '''
+
+    def __init__(self, workers, chat_queue_size, worker_queue_size):
+
+        self.chat_queue_size = chat_queue_size
+        self.queues = [Queue(maxsize=worker_queue_size) for _ in range(workers)]
+        self._chat_depths = defaultdict(int)  # chat_id -> updates queued and not processed yet
+        self.threads = [
+            Thread(target=self._work, args=(index,), name=f'chat_worker_{index}', daemon=True)
+            for index in range(workers)
+        ]
+        self._lock = Lock()
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        '''Starts the workers.'''
+
+        for thread in self.threads:
+            thread.start()
+
+        logger.info('Chat executor started with %d workers', len(self.threads))
+
+    def stop(self):
+        '''Lets the workers finish their queues and stops them.'''
+
+        for queue in self.queues:
+            queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+        logger.info('Chat executor stopped')
+
+    def wrap(self, callback):
+        '''Returns a handler callback that submits the original one to the executor.'''
+
+        @wraps(callback)
+        def submit_callback(update, context):
+            self.submit(callback, update, context)
+
+        return submit_callback
+
+    def submit(self, callback, update, context):
+        '''Queues a handler call on the worker owning the chat of the update.'''
+
+        chat_id = update.effective_chat.id if update.effective_chat else 0
+        queue = self.queues[hash(chat_id) % len(self.queues)]
+
+        with self._lock:
+            admitted = self._chat_depths[chat_id] < self.chat_queue_size
+
+            if admitted:
+                try:
+                    queue.put_nowait((callback, update, context, chat_id, monotonic()))
+
+                except Full:
+                    admitted = False
+
+            if admitted:
+                self._chat_depths[chat_id] += 1
+                self.submitted += 1
+
+            else:
+                self.dropped += 1
+
+        if not admitted:
+            logger.warning('Queue of chat %s is full, update dropped', chat_id, extra={'chat_id': chat_id})
+
+            if update.callback_query:
+                context.dispatcher.run_async(answer_dropped, update.callback_query, chat_id)
+
+    def metrics(self):
+        '''Returns queue depths, processed and dropped updates and queue wait times.'''
+
+        with self._lock:
+            average_wait = self.total_wait / self.processed if self.processed else 0.0
+
+            return {
+                'queue_depth': [queue.qsize() for queue in self.queues],
+                'busy_chats': len(self._chat_depths),
+                'max_chat_depth': max(self._chat_depths.values(), default=0),
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'average_wait': round(average_wait, 4),
+                'max_wait': round(self.max_wait, 4)
+            }
+
+    def _work(self, index):
+
+        queue = self.queues[index]
+
+        while True:
+            task = queue.get()
+
+            if task is None:
+                break
+
+            callback, update, context, chat_id, enqueued = task
+            wait = monotonic() - enqueued
+
+            with self._lock:
+                self.processed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            try:
+                callback(update, context)
+
+            except Exception:
+                logger.exception('Error while handling update in %s', callback.__name__, extra={'chat_id': chat_id})
+
+            finally:
+                with self._lock:
+                    self._chat_depths[chat_id] -= 1
+
+                    if not self._chat_depths[chat_id]:
+                        del self._chat_depths[chat_id]
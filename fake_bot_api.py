@@ -0,0 +1,488 @@
+'''Local stand-in for the Telegram Bot API, used to load test the bot offline.
+
+Start it, then point the bot at it:
+
+    $ python3 fake_bot_api.py --chats 50
+    $ python3 main.py --base-url http://127.0.0.1:8081/bot
+
+Every synthetic chat replays the script, one line at a time: the next line is
+injected when the bot has answered the previous one in every chat, when the
+bot has been silent for --quiet-period seconds or after --round-timeout seconds.
+Commands are answered by the first message or edit of the bot in their chat,
+button presses by their answerCallbackQuery. Updates still unanswered at the
+end of a line (e.g. throttled ones) are counted and forgotten. At the end a
+summary with response latencies, flood limit hits and API calls is logged.
+'''
+
+from collections import defaultdict, deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep, time
+from urllib.parse import parse_qsl, urlparse
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+
+from log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'SportSchedulerBot',
+    'username': 'sport_scheduler_bot'
+}
+FIRST_CHAT_ID = -1001
+FIRST_USER_ID = 10001
+NEXT_WEEK = (date.today() + timedelta(days=7)).strftime('%d/%m/%Y')
+DEFAULT_SCRIPT = [
+    '/start',
+    f'/newmatch tennis {NEXT_WEEK} 18:00 01:30',
+    '/matchlist',
+    '/matchinfo {match}',
+    '[Join]',
+    '/leave {match}',
+    '/join {match}',
+    '/matchlist',
+    '/stats'
+]
+NEW_MATCH_PATTERN = re.compile(r'Match (\d+) has been successfully created')
+
+
+class FloodLimitError(Exception):
+    '''To be raised when a chat or the whole bot sends messages too fast.'''
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f'Too Many Requests: retry after {retry_after}')
+
+
+class FakeBotApi:
+    '''State of the fake Bot API: pending updates, sent messages, flood limits and timings.'''
+
+    def __init__(self, chat_rate, global_rate):
+
+        self.chat_rate = chat_rate  # messages per second per chat
+        self.global_rate = global_rate  # messages per second overall
+        self.lock = Lock()
+        self.updates_available = Condition(self.lock)
+        self.updates = []
+        self.next_update_id = 1
+        self.next_message_id = defaultdict(lambda: 1)
+        self.messages = {}  # (chat_id, message_id) -> message
+        self.keyboards = {}  # chat_id -> last message with an inline keyboard
+        self.last_match = {}  # chat_id -> id of the last match created in the chat
+        self.sent_times = defaultdict(deque)  # chat_id -> send times in the last second
+        self.global_sent_times = deque()
+        self.waiting_commands = defaultdict(deque)  # chat_id -> injection times of unanswered commands
+        self.waiting_callbacks = {}  # callback_query_id -> injection time of the unanswered press
+        self.last_activity = monotonic()  # time of the last message, edit or answer of the bot
+        self.latencies = []
+        self.unanswered = 0
+        self.calls = defaultdict(int)
+        self.flood_limited = 0
+
+    # injection of synthetic updates
+
+    def inject_command(self, chat_id, user_id, text):
+        '''Queues a message sent by a user in a group chat.'''
+
+        with self.lock:
+            message_id = self.next_message_id[chat_id]
+            self.next_message_id[chat_id] += 1
+            message = {
+                'message_id': message_id,
+                'date': int(time()),
+                'chat': get_chat(chat_id),
+                'from': get_user(user_id),
+                'text': text
+            }
+
+            if text.startswith('/'):
+                command = text.split()[0]
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+
+            self.messages[(chat_id, message_id)] = message
+            self.add_update({'message': message})
+            self.waiting_commands[chat_id].append(monotonic())
+
+    def inject_button(self, chat_id, user_id, label):
+        '''Queues a press of the button with the given label on the last keyboard of the chat.'''
+
+        with self.lock:
+            message = self.keyboards.get(chat_id)
+
+            if message is None:
+                logger.warning('No keyboard to press %s on in chat %s', label, chat_id)
+                return
+
+            buttons = [
+                button for row in message['reply_markup']['inline_keyboard']
+                for button in row if button['text'] == label
+            ]
+
+            if not buttons:
+                logger.warning('No button %s in chat %s', label, chat_id)
+                return
+
+            callback_query_id = str(self.next_update_id)
+            callback_query = {
+                'id': callback_query_id,
+                'from': get_user(user_id),
+                'chat_instance': str(chat_id),
+                'message': message,
+                'data': buttons[0]['callback_data']
+            }
+            self.add_update({'callback_query': callback_query})
+            self.waiting_callbacks[callback_query_id] = monotonic()
+
+    def add_update(self, content):
+        '''Queues an update for getUpdates.'''
+
+        update = {'update_id': self.next_update_id, **content}
+        self.next_update_id += 1
+        self.updates.append(update)
+        self.updates_available.notify_all()
+
+    def has_unanswered(self):
+        '''Checks whether some of the injected updates are still unanswered.'''
+
+        with self.lock:
+            return bool(self.waiting_callbacks) or any(self.waiting_commands.values())
+
+    def end_round(self):
+        '''Counts and forgets the updates left unanswered, so that later replies are not credited to them.'''
+
+        with self.lock:
+            self.unanswered += len(self.waiting_callbacks) + sum(map(len, self.waiting_commands.values()))
+            self.waiting_callbacks.clear()
+            self.waiting_commands.clear()
+
+    # Bot API methods
+
+    def call(self, method, params):
+        '''Executes a Bot API method and returns its result.'''
+
+        with self.lock:
+            self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return self.get_updates(params)
+
+        with self.lock:
+
+            if method == 'getMe':
+                return BOT_USER
+
+            if method == 'deleteWebhook':
+                return True
+
+            if method == 'sendMessage':
+                return self.send_message(params)
+
+            if method == 'editMessageText':
+                return self.edit_message_text(params)
+
+            if method == 'editMessageReplyMarkup':
+                return self.edit_message_reply_markup(params)
+
+            if method == 'getChatMember':
+                return {'user': get_user(int(params['user_id'])), 'status': 'member'}
+
+            if method == 'answerCallbackQuery':
+                self.last_activity = monotonic()
+                injected = self.waiting_callbacks.pop(params['callback_query_id'], None)
+
+                if injected is not None:
+                    self.latencies.append(monotonic() - injected)
+
+                return True
+
+        raise KeyError(method)
+
+    def get_updates(self, params):
+        '''Returns the updates from offset on, waiting up to timeout seconds for new ones.'''
+
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        deadline = monotonic() + float(params.get('timeout', 0))
+
+        with self.lock:
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+
+            while not self.updates and monotonic() < deadline:
+                self.updates_available.wait(deadline - monotonic())
+
+            return self.updates[:limit]
+
+    def send_message(self, params):
+        '''Stores a message sent by the bot and returns it.'''
+
+        chat_id = int(params['chat_id'])
+        self.check_flood_limit(chat_id)
+        message_id = self.next_message_id[chat_id]
+        self.next_message_id[chat_id] += 1
+        message = {
+            'message_id': message_id,
+            'date': int(time()),
+            'chat': get_chat(chat_id),
+            'from': BOT_USER,
+            'text': params['text']
+        }
+        self.store_bot_message(chat_id, message, params.get('reply_markup'))
+
+        new_match = NEW_MATCH_PATTERN.search(params['text'])
+
+        if new_match:
+            self.last_match[chat_id] = new_match.group(1)
+
+        self.answer_command(chat_id)
+
+        return message
+
+    def edit_message_text(self, params):
+        '''Edits a message sent by the bot, same errors as Telegram for missing or unmodified messages.'''
+
+        chat_id = int(params['chat_id'])
+        message = self.messages.get((chat_id, int(params['message_id'])))
+
+        if message is None:
+            raise LookupError('Bad Request: message to edit not found')
+
+        if message['text'] == params['text']:
+            raise LookupError('Bad Request: message is not modified')
+
+        self.check_flood_limit(chat_id)
+        message = {**message, 'text': params['text'], 'edit_date': int(time())}
+        message.pop('reply_markup', None)
+        self.store_bot_message(chat_id, message, params.get('reply_markup'))
+
+        self.answer_command(chat_id)  # e.g. /join answered by the edit of the roster
+
+        return message
+
+    def edit_message_reply_markup(self, params):
+        '''Replaces or removes the inline keyboard of a message sent by the bot.'''
+
+        chat_id = int(params['chat_id'])
+        message = self.messages.get((chat_id, int(params['message_id'])))
+
+        if message is None:
+            raise LookupError('Bad Request: message to edit not found')
+
+        reply_markup = params.get('reply_markup')
+
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+
+        if message.get('reply_markup') == (reply_markup or None):
+            raise LookupError('Bad Request: message is not modified')
+
+        self.check_flood_limit(chat_id)
+        message = {**message, 'edit_date': int(time())}
+        message.pop('reply_markup', None)
+
+        if not reply_markup and self.keyboards.get(chat_id, {}).get('message_id') == message['message_id']:
+            del self.keyboards[chat_id]
+
+        self.store_bot_message(chat_id, message, reply_markup)
+
+        return message
+
+    def store_bot_message(self, chat_id, message, reply_markup):
+        '''Stores a message of the bot, remembering the last inline keyboard of the chat.'''
+
+        if reply_markup:
+            message['reply_markup'] = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+            self.keyboards[chat_id] = message
+
+        self.messages[(chat_id, message['message_id'])] = message
+
+    def answer_command(self, chat_id):
+        '''Records the latency of the oldest unanswered command of the chat.'''
+
+        self.last_activity = monotonic()
+
+        if self.waiting_commands[chat_id]:
+            self.latencies.append(self.last_activity - self.waiting_commands[chat_id].popleft())
+
+    def check_flood_limit(self, chat_id):
+        '''Raises FloodLimitError when the chat or the whole bot exceed their rate.'''
+
+        now = monotonic()
+
+        for sent_times, rate in ((self.sent_times[chat_id], self.chat_rate), (self.global_sent_times, self.global_rate)):
+
+            while sent_times and now - sent_times[0] >= 1:
+                sent_times.popleft()
+
+            if len(sent_times) >= rate:
+                self.flood_limited += 1
+                raise FloodLimitError(math.ceil(1 - (now - sent_times[0])))
+
+        self.sent_times[chat_id].append(now)
+        self.global_sent_times.append(now)
+
+    def summary(self):
+        '''Returns latencies of the answers, flood limit hits and number of calls per method.'''
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            unanswered = self.unanswered + len(self.waiting_callbacks) + sum(map(len, self.waiting_commands.values()))
+
+            def percentile(fraction):
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 4)
+
+            return {
+                'answered': len(latencies),
+                'unanswered': unanswered,
+                'latency_p50': percentile(0.5),
+                'latency_p95': percentile(0.95),
+                'latency_max': round(latencies[-1], 4) if latencies else None,
+                'flood_limited': self.flood_limited,
+                'calls': dict(self.calls)
+            }
+
+
+def get_chat(chat_id):
+    '''Returns the Bot API representation of a synthetic group chat.'''
+
+    return {'id': chat_id, 'type': 'group', 'title': f'Chat {chat_id}'}
+
+
+def get_user(user_id):
+    '''Returns the Bot API representation of a synthetic user.'''
+
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+
+def create_request_handler(api):
+    '''Returns the HTTP request handler class serving the given fake API.'''
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            self.handle_call(dict(parse_qsl(urlparse(self.path).query)))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length).decode() if length else ''
+
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params = json.loads(body) if body else {}
+
+            else:
+                params = dict(parse_qsl(body))
+
+            self.handle_call(params)
+
+        def handle_call(self, params):
+            method = urlparse(self.path).path.rsplit('/', 1)[-1]
+
+            try:
+                result = api.call(method, params)
+                self.respond(200, {'ok': True, 'result': result})
+
+            except FloodLimitError as error:
+                self.respond(429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': str(error),
+                    'parameters': {'retry_after': error.retry_after}
+                })
+
+            except LookupError as error:  # KeyError for unknown methods is a LookupError too
+                if isinstance(error, KeyError):
+                    self.respond(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                else:
+                    self.respond(400, {'ok': False, 'error_code': 400, 'description': str(error)})
+
+        def respond(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return RequestHandler
+
+
+def run_script(api, script, chats, users, round_timeout, quiet_period):
+    '''Replays the script in every synthetic chat, a line at a time.'''
+
+    chat_ids = [FIRST_CHAT_ID - index for index in range(chats)]
+
+    for line in script:
+
+        for chat_id in chat_ids:
+            user_id = random.randrange(FIRST_USER_ID, FIRST_USER_ID + users)
+
+            if line.startswith('[') and line.endswith(']'):
+                api.inject_button(chat_id, user_id, line[1:-1])
+
+            else:
+                api.inject_command(chat_id, user_id, line.format(match=api.last_match.get(chat_id, 0)))
+
+        started = monotonic()
+        deadline = started + round_timeout
+
+        while api.has_unanswered() and monotonic() < deadline:
+
+            if monotonic() - max(started, api.last_activity) > quiet_period:  # the rest was throttled or dropped
+                break
+
+            sleep(0.01)
+
+        api.end_round()
+        logger.info('Script line "%s" replayed in %d chats', line, chats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API server for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--script', help='file with a command per line, [Label] presses a button')
+    parser.add_argument('--chats', type=int, default=10, help='number of synthetic chats')
+    parser.add_argument('--users', type=int, default=5, help='number of users in each chat')
+    parser.add_argument('--chat-rate', type=int, default=20, help='messages per second per chat before 429')
+    parser.add_argument('--global-rate', type=int, default=30, help='messages per second before 429')
+    parser.add_argument('--round-timeout', type=float, default=10, help='seconds to wait for answers to a line')
+    parser.add_argument('--quiet-period', type=float, default=3, help='seconds without bot calls that end a line')
+    parser.add_argument('--start-delay', type=float, default=5, help='seconds to wait for the bot to connect')
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.script:
+        with open(args.script, 'r') as file:
+            script = [line.strip() for line in file.read().split('\n') if line.strip()]
+
+    else:
+        script = DEFAULT_SCRIPT
+
+    api = FakeBotApi(args.chat_rate, args.global_rate)
+    server = ThreadingHTTPServer((args.host, args.port), create_request_handler(api))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Fake Bot API listening on http://%s:%s/bot', args.host, args.port)
+
+    sleep(args.start_delay)
+    started = monotonic()
+    run_script(api, script, args.chats, args.users, args.round_timeout, args.quiet_period)
+    logger.info('Script completed in %.2f s: %s', monotonic() - started, api.summary())
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ from utils import (
 from db_manager import (
     SPORT_TYPES,
     Match,
+    find_match,
     store_in_db,
     get_matches_from_chat,
     overwrite_line
@@ -24,9 +25,20 @@ from exceptions import (
     UnauthorizedUserError
 )
 from reminder import Reminder
-from config import CONFIG
+from archive import compute_stats
+from calendar_feed import CALENDAR_CONFIG, get_feed_url
+from cache import get_chat_version, get_cached_list, cache_list
+from player_names import PLAYER_NAMES
+from roster import (
+    post_roster,
+    bind_roster,
+    has_roster,
+    is_live_roster,
+    retire_message,
+    schedule_roster_update,
+    close_roster
+)
 
-logging.basicConfig(format=CONFIG['logging']['format'], level=CONFIG['logging']['level'])
 logger = logging.getLogger(__name__)
 
 
@@ -55,8 +67,10 @@ def show_help(update, context):
              '/join <match id>, to join a match\n'
              '/leave <match id>, to abandon a match\n'
              '/remove <match id>, to cancel a match\n'
-             '/matchinfo <match id>, shows information about a given match\n'
+             '/matchinfo <match id>, shows information about a given match and its Join/Leave buttons\n'
              '/matchlist, shows all the matches scheduled in this chat\n'
+             '/stats, shows statistics about the matches played in this chat\n'
+             '/calendar, gives the link to add the matches of this chat to your calendar\n'
         )
 
 
@@ -111,10 +125,12 @@ def new_match(update, context):
         raise EventInThePastError(context, chat_id)
 
     match_id = store_in_db(match)
-    context.bot.send_message(
-        chat_id=chat_id,
-        text=f'Match {match_id} has been successfully created.\n'
-             f'{match_id} must be specified when using the commands /matchinfo, /update, /join, /leave and /remove as first argument.'
+    post_roster(
+        context,
+        chat_id,
+        match,
+        header=f'Match {match_id} has been successfully created.\n'
+               f'{match_id} must be specified when using the commands /matchinfo, /update, /join, /leave and /remove as first argument.'
     )
 
     Reminder(update, context, match_id)
@@ -131,33 +147,36 @@ def get_info(update, context):
         raise InputSizeError(context, chat_id, len(parsed_data), 1)
 
     _, match, __ = get_match_in_db(context, match_id, chat_id)
-    text = match.create_info_message()
-    context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=text
-    )
+    post_roster(context, chat_id, match)
 
 
 def get_list(update, context):
     '''Allows the user to see all the match scheduled in the chat she belongs to.'''
 
     chat_id, _ = get_message_info(update)
+    text = get_cached_list(chat_id)
 
-    try:
-        matches = get_matches_from_chat(chat_id)
+    if text is None:
+        version = get_chat_version(chat_id)
 
-    except FileNotFoundError:
-        raise DatabaseNotFoundError(context, chat_id)
+        try:
+            matches = get_matches_from_chat(chat_id)
 
-    if matches:
-        text = ''
+        except FileNotFoundError:
+            raise DatabaseNotFoundError(context, chat_id)
 
-        for match in matches:
-            match_text = match.create_info_message()
-            text = f'{match_text}\n{text}'
+        if matches:
+            text = ''
 
-    else:
-        text = 'No matches found, create a new one with /newmatch'
+            for match in matches:
+                match_text = match.create_info_message()
+                text = f'{match_text}\n{text}'
+
+        else:
+            text = 'No matches found, create a new one with /newmatch'
+
+        players = [player for match in matches for player in match.players_list]
+        cache_list(chat_id, version, players, text)
 
     context.bot.send_message(
         chat_id=update.effective_chat.id,
@@ -165,6 +184,60 @@ def get_list(update, context):
     )
 
 
+def get_stats(update, context):
+    '''Shows statistics about the finished matches of the chat.'''
+
+    chat_id, _ = get_message_info(update)
+    stats = compute_stats(chat_id)
+
+    if stats is None:
+        context.bot.send_message(
+            chat_id=chat_id,
+            text='No matches played in this chat yet'
+        )
+        return
+
+    def format_counts(counts):
+        return ', '.join(f'{label} ({count})' for label, count in counts)
+
+    player_ids = [player for player, _ in stats['most_active_players']]
+    player_names = PLAYER_NAMES.get_names(player_ids, chat_id)
+    most_active_players = [
+        (name, count) for name, (_, count) in zip(player_names, stats['most_active_players'])
+    ]
+
+    text = (
+        f'Matches played: {stats["games"]}\n'
+        f'Matches per sport: {format_counts(stats["games_per_sport"].items())}\n'
+        f'Most active players: {format_counts(most_active_players)}\n'
+        f'Busiest weekdays: {format_counts(stats["busiest_weekdays"])}\n'
+        f'Busiest hours: {format_counts(stats["busiest_hours"])}'
+    )
+
+    if stats['fill_rate'] is not None:
+        text = f'{text}\nAverage fill rate: {stats["fill_rate"]:.0%} of the required players'
+    context.bot.send_message(
+        chat_id=chat_id,
+        text=text
+    )
+
+
+def get_calendar(update, context):
+    '''Sends the link of the calendar feed of the chat.'''
+
+    chat_id, _ = get_message_info(update)
+
+    if not CALENDAR_CONFIG['enabled']:
+        context.bot.send_message(chat_id=chat_id, text='Calendar feeds are not enabled for this bot')
+        return
+
+    context.bot.send_message(
+        chat_id=chat_id,
+        text=f'Subscribe to this link with your calendar app to see the matches of this chat:\n'
+             f'{get_feed_url(chat_id)}'
+    )
+
+
 def update_event(update, context):
     '''Allows user to modify some fields of the match.'''
 
@@ -228,7 +301,7 @@ def update_event(update, context):
         match.duration = event_duration
 
     else:
-        logger.error(f'Unrecognized field {field}')
+        logger.error('Unrecognized field %s', field, extra={'chat_id': chat_id, 'match_id': match_id})
         context.bot.send_message(
             chat_id=chat_id,
             text='Unrecognized field, it is only possible to update sport type,'
@@ -237,12 +310,13 @@ def update_event(update, context):
         raise ValueError(f'Unrecognized field {field}')
 
     overwrite_line(db_as_list, target_index, match)
+    schedule_roster_update(context, match_id)
 
     context.bot.send_message(
         chat_id=chat_id,
         text=f'Match has been successfully updated'
     )
-    logger.info('Match successfully updated')
+    logger.info('Match successfully updated', extra={'chat_id': chat_id, 'match_id': match_id})
 
 
 def join_event(update, context):
@@ -274,11 +348,16 @@ def join_event(update, context):
     else:
         match.add_player(str(user_id))
         overwrite_line(db, index, match)
-        context.bot.send_message(
-            chat_id=chat_id,
-            text=f'User has successfully joined match {match_id}'
-        )
-        logger.info('User has successfully joined the match')
+        logger.info('User has successfully joined the match', extra={'chat_id': chat_id, 'match_id': match_id})
+
+        if has_roster(match_id):  # the roster message shows the new player
+            schedule_roster_update(context, match_id)
+
+        else:
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=f'User has successfully joined match {match_id}'
+            )
 
 
 def leave_event(update, context):
@@ -297,11 +376,16 @@ def leave_event(update, context):
 
         match.remove_player(str(user_id))
         overwrite_line(db, index, match)
-        context.bot.send_message(
-            chat_id=chat_id,
-            text='User removed from the match'
-        )
-        logger.info('User has successfully left the match')
+        logger.info('User has successfully left the match', extra={'chat_id': chat_id, 'match_id': match_id})
+
+        if has_roster(match_id):
+            schedule_roster_update(context, match_id)
+
+        else:
+            context.bot.send_message(
+                chat_id=chat_id,
+                text='User removed from the match'
+            )
 
     else:
         context.bot.send_message(
@@ -330,9 +414,73 @@ def delete_event(update, context):
             chat_id=chat_id,
             text=f'Match {match_id} removed from database'
         )
-        logger.info('Match removed from database')
+        logger.info('Match removed from database', extra={'chat_id': chat_id, 'match_id': match_id})
         Reminder.remove_job(context, match.match_id)
+        close_roster(context, match_id, f'Match {match_id} has been cancelled')
 
     else:
         raise UnauthorizedUserError(context, chat_id, match_id)
 
+
+def roster_button(update, context):
+    '''Handles the Join/Leave buttons of the roster messages.'''
+
+    query = update.callback_query
+    action, match_id = query.data.split(':')
+    chat_id = query.message.chat_id
+    player = str(query.from_user.id)
+    message_id = query.message.message_id
+    PLAYER_NAMES.remember(query.from_user)
+
+    try:
+        db, match, index = find_match(match_id, chat_id)
+
+    except PermissionError:
+        query.answer(f'Match {match_id} belongs to another chat')
+        retire_message(context, chat_id, message_id)
+        return
+
+    except (FileNotFoundError, KeyError):
+        text = f'Match {match_id} is no longer available'
+        query.answer(text)
+
+        if not is_live_roster(match_id, chat_id, message_id):
+            retire_message(context, chat_id, message_id, text)
+
+        close_roster(context, match_id, text)
+        return
+
+    if not has_roster(match_id):  # live rosters are forgotten when the bot restarts
+        bind_roster(match_id, chat_id, message_id)
+
+    elif not is_live_roster(match_id, chat_id, message_id):
+        query.answer('This roster is outdated, use the latest one')
+        retire_message(context, chat_id, message_id)
+        return
+
+    if action == 'join':
+
+        if player in match.players_list:
+            query.answer('You already joined this match')
+            return
+
+        if match.is_match_full():
+            query.answer(f'Match {match_id} has already reached the maximum number of players')
+            return
+
+        match.add_player(player)
+        text = f'You joined match {match_id}'
+
+    else:
+
+        if player not in match.players_list:
+            query.answer('You are not among the players of this match')
+            return
+
+        match.remove_player(player)
+        text = f'You left match {match_id}'
+
+    overwrite_line(db, index, match)
+    query.answer(text)
+    schedule_roster_update(context, match_id)
+    logger.info('Roster of match %s updated', match_id, extra={'chat_id': chat_id, 'match_id': match_id})
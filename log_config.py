@@ -0,0 +1,120 @@
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+
+import atexit
+import copy
+import json
+import logging
+
+from config import CONFIG
+
+CONTEXT_FIELDS = ('chat_id', 'match_id')  # passed with extra={...}, shown in the JSON output
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats records as JSON lines, including chat and match ids when given.'''
+
+    def format(self, record):
+
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        for name in CONTEXT_FIELDS:
+            if hasattr(record, name):
+                entry[name] = str(getattr(record, name))
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:  # formatted by LoggingQueueHandler before the record is queued
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry)
+
+
+class LoggingQueueHandler(QueueHandler):
+    '''Queues records for the background writer, keeping the traceback apart from the message.
+
+    QueueHandler.prepare merges the traceback into the message and drops it,
+    here it is formatted into exc_text, which every formatter knows how to show.
+    '''
+
+    def prepare(self, record):
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    '''Keeps one record every n of each high frequency event.
+
+    Records take part in sampling when logged with extra={'sample': <event>},
+    n is set per event in the sampling section of the logging configuration.
+    '''
+
+    def __init__(self, rates):
+
+        super().__init__()
+        self.rates = rates
+        self._counts = defaultdict(int)
+        self._lock = Lock()
+
+    def filter(self, record):
+
+        event = getattr(record, 'sample', None)
+
+        if event is None or self.rates.get(event, 1) <= 1:
+            return True
+
+        with self._lock:
+            count = self._counts[event]
+            self._counts[event] = count + 1
+
+        return count % self.rates[event] == 0
+
+
+def setup_logging():
+    '''Configures logging once: records are queued by the caller and written by a background thread.'''
+
+    logging_config = CONFIG['logging']
+
+    if logging_config['json']:
+        formatter = JsonFormatter()
+
+    else:
+        formatter = logging.Formatter(logging_config['format'])
+
+    handlers = [logging.StreamHandler()]
+
+    if logging_config['file']:
+        handlers.append(logging.FileHandler(logging_config['file']))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = SimpleQueue()
+    queue_handler = LoggingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(logging_config['sampling']))
+
+    root = logging.getLogger()
+    root.setLevel(logging_config['level'])
+    root.handlers = [queue_handler]
+
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)  # flushes the records still in the queue
+
+    return listener
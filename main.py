@@ -1,35 +1,93 @@
-from telegram.ext import Updater, CommandHandler
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler
 
 from config import CONFIG
+from executor import ChatExecutor
+from admission import AdmissionControl
+from player_names import PLAYER_NAMES
+from calendar_feed import start_calendar_server
+from log_config import setup_logging
 from handlers import *
 
+import argparse
 import logging
 
 
-logging.basicConfig(format=CONFIG['logging']['format'], level=CONFIG['logging']['level'])
 logger = logging.getLogger(__name__)
 
 
+def log_metrics(context):
+    '''Logs the metrics of the chat executor and of the admission control.'''
+
+    executor, admission = context.job.context
+    logger.info('Chat executor metrics: %s', executor.metrics())
+    logger.info('Admission control metrics: %s', admission.metrics())
+
+
 def main():
-    updater = Updater(token=CONFIG['bot_token'], use_context=True)
+    parser = argparse.ArgumentParser(description='Sport scheduler Telegram bot')
+    parser.add_argument('--base-url', default=CONFIG['base_url'],
+                        help='Bot API base URL, e.g. http://127.0.0.1:8081/bot for fake_bot_api.py')
+    args = parser.parse_args()
+    setup_logging()
+
+    updater = Updater(token=CONFIG['bot_token'], base_url=args.base_url, use_context=True)
     dispatcher = updater.dispatcher
+    executor_config = CONFIG['executor']
+    executor = ChatExecutor(
+        workers=executor_config['workers'],
+        chat_queue_size=executor_config['chat_queue_size'],
+        worker_queue_size=executor_config['worker_queue_size']
+    )
+    admission_config = CONFIG['admission']
+    admission = AdmissionControl(
+        budgets={kind: admission_config[kind] for kind in ('read', 'write')},
+        notice_window=admission_config['notice_window'],
+        executor=executor
+    )
+
+    def read(callback):  # commands over budget are shed before being queued
+        return admission.wrap(executor.wrap(callback), 'read')
 
-    dispatcher.add_handler(CommandHandler('start', start))
-    dispatcher.add_handler(CommandHandler('help', show_help))
-    dispatcher.add_handler(CommandHandler('showsports', show_sports))
-    dispatcher.add_handler(CommandHandler('newmatch', new_match))
-    dispatcher.add_handler(CommandHandler('matchinfo', get_info))
-    dispatcher.add_handler(CommandHandler('matchlist', get_list))
-    dispatcher.add_handler(CommandHandler('update', update_event))
-    dispatcher.add_handler(CommandHandler('join', join_event))
-    dispatcher.add_handler(CommandHandler('leave', leave_event))
-    dispatcher.add_handler(CommandHandler('remove', delete_event))
+    def write(callback):
+        return admission.wrap(executor.wrap(callback), 'write')
+
+    dispatcher.add_handler(CommandHandler('start', read(start)))
+    dispatcher.add_handler(CommandHandler('help', read(show_help)))
+    dispatcher.add_handler(CommandHandler('showsports', read(show_sports)))
+    dispatcher.add_handler(CommandHandler('newmatch', write(new_match)))
+    dispatcher.add_handler(CommandHandler('matchinfo', read(get_info)))
+    dispatcher.add_handler(CommandHandler('matchlist', read(get_list)))
+    dispatcher.add_handler(CommandHandler('stats', read(get_stats)))
+    dispatcher.add_handler(CommandHandler('calendar', read(get_calendar)))
+    dispatcher.add_handler(CommandHandler('update', write(update_event)))
+    dispatcher.add_handler(CommandHandler('join', write(join_event)))
+    dispatcher.add_handler(CommandHandler('leave', write(leave_event)))
+    dispatcher.add_handler(CommandHandler('remove', write(delete_event)))
+    dispatcher.add_handler(CallbackQueryHandler(write(roster_button), pattern=r'^(join|leave):'))
     # possibly other commands lol
 
+    updater.job_queue.run_repeating(
+        log_metrics,
+        interval=executor_config['metrics_interval'],
+        context=(executor, admission),
+        name='metrics'
+    )
+
+    updater.job_queue.run_repeating(
+        PLAYER_NAMES.refresh,
+        interval=CONFIG['player_names']['refresh_interval'],
+        name='player_names_refresh'
+    )
+
+    if CONFIG['calendar']['enabled']:
+        start_calendar_server()
+
+    executor.start()
     logger.info('Bot started')
     updater.start_polling()
 
     updater.idle()
+    executor.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from telegram.error import TelegramError
+
+import logging
+
+from cache import invalidate_player
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class NameCache:
+    '''LRU cache of the display names of the players, entries expire after ttl seconds.
+
+    Names are learnt for free from the users sending commands. Unknown or
+    expired players are queued and resolved in batches by refresh, which runs
+    on the job queue, so rendering a message never calls the API.
+    '''
+
+    def __init__(self, ttl, max_size, batch_size):
+
+        self.ttl = ttl
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._names = OrderedDict()  # user_id -> (display name, expiry)
+        self._pending = OrderedDict()  # user_id -> chat_id to look the user up in
+        self._lock = Lock()
+
+    def remember(self, user, queued=False):
+        '''Stores the display name of a telegram user, queued when it was looked up by refresh.'''
+
+        user_id = str(user.id)
+        name = user.full_name
+
+        with self._lock:
+            cached = self._names.pop(user_id, None)
+            self._names[user_id] = (name, monotonic() + self.ttl)
+            queued = self._pending.pop(user_id, None) is not None or queued
+
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+        # only messages rendered with the old name, or with the id of a queued unknown player, are stale
+        if (cached is not None and cached[0] != name) or (cached is None and queued):
+            invalidate_player(user_id)
+
+    def get(self, user_id, chat_id):
+        '''Returns the name of a player, None if unknown. Unknown and expired players are queued for refresh.'''
+
+        user_id = str(user_id)
+
+        with self._lock:
+            cached = self._names.get(user_id)
+
+            if cached is None or cached[1] < monotonic():
+                self._pending.setdefault(user_id, chat_id)
+
+            if cached is None:
+                return None
+
+            self._names.move_to_end(user_id)
+
+            return cached[0]  # expired names are still shown until they are refreshed
+
+    def get_names(self, players, chat_id):
+        '''Returns the display names of the players, ids are shown for unknown players.'''
+
+        return [self.get(player, chat_id) or player for player in players]
+
+    def refresh(self, context):
+        '''Resolves a batch of unknown or expired players through the API, run as a repeating job.'''
+
+        with self._lock:
+            batch = [self._pending.popitem(last=False) for _ in range(min(self.batch_size, len(self._pending)))]
+
+        for user_id, chat_id in batch:
+
+            try:
+                member = context.bot.get_chat_member(chat_id, user_id)
+
+            except TelegramError as error:
+                logger.warning('Name of user %s not retrieved: %s', user_id, error, extra={'chat_id': chat_id})
+
+                with self._lock:  # not retried before the ttl expires
+                    cached = self._names.get(user_id)
+                    self._names[user_id] = (cached[0] if cached else user_id, monotonic() + self.ttl)
+
+                continue
+
+            self.remember(member.user, queued=True)  # already popped from _pending
+
+        if batch:
+            logger.debug('Refreshed %d player names', len(batch))
+
+
+PLAYER_NAMES = NameCache(
+    ttl=CONFIG['player_names']['ttl'],
+    max_size=CONFIG['player_names']['max_size'],
+    batch_size=CONFIG['player_names']['batch_size']
+)
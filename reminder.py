@@ -3,9 +3,9 @@ from datetime import datetime, timedelta
 import logging
 
 from db_manager import find_match, overwrite_line
-from config import CONFIG
+from roster import close_roster
+from archive import archive_match
 
-logging.basicConfig(format=CONFIG['logging']['format'], level=CONFIG['logging']['level'])
 logger = logging.getLogger(__name__)
 
 
@@ -22,6 +22,10 @@ class Reminder:
         '''Alerts users in the group until required number of players is reached.'''
 
         job = context.job
+        logger.debug(
+            'Reminder tick for match %s', self.match_id,
+            extra={'chat_id': job.context, 'match_id': self.match_id, 'sample': 'reminder_tick'}
+        )
         match = find_match(self.match_id)[1]
         time_left = match.get_time_to_event()
         time_left_str = str(time_left).split('.')[0]
@@ -30,7 +34,10 @@ class Reminder:
         time_left_text = f'Match happening in {time_left_str}.'
 
         if missing_players > 0:
-  
+
+            if match.players_list:
+                text = f'{text}\nPlayers so far: {match.get_player_names()}.'
+
             text = f'{text}\n{time_left_text}'
             self.match_context.bot.send_message(
                 chat_id=job.context,
@@ -48,11 +55,13 @@ class Reminder:
         )
 
     def remove_match(self, context):
-        '''Removes a match from the database after it has happened.'''
+        '''Moves a match from the database to the archive after it has happened.'''
 
         db, match, index = find_match(self.match_id)
+        archive_match(match)
         overwrite_line(db, index)
-        logger.info(f'Match {self.match_id} is happening right now. Removing it from database.')
+        logger.info('Match %s is happening right now. Removing it from database.', self.match_id, extra={'chat_id': match.chat_id, 'match_id': self.match_id})
+        close_roster(context, self.match_id, f'Match {self.match_id} has started')
 
     @staticmethod
     def remove_job(context, match_id):
@@ -64,14 +73,14 @@ class Reminder:
             current_jobs = context.job_queue.get_jobs_by_name(name)
 
             if not current_jobs:
-                logger.warning(f'Job associated to match {name} has been already removed')
+                logger.warning('Job associated to match %s has been already removed', name, extra={'match_id': match_id})
 
             elif len(current_jobs) > 1:
                 raise ValueError(f'There mustn\'t be more than one job per match_id {name}')
 
             else:
                 current_jobs[0].schedule_removal()
-                logger.info(f'Match {name} reminder has been disabled')
+                logger.info('Match %s reminder has been disabled', name, extra={'match_id': match_id})
 
     def set_alerts(self):
         '''Add alerts to the queue.'''
@@ -103,7 +112,7 @@ class Reminder:
             context=chat_id,
             name=remove_match_job_name
         )
-        logger.info(f'Reminder for match {self.match_id} has been set.')
+        logger.info('Reminder for match %s has been set.', self.match_id, extra={'chat_id': chat_id, 'match_id': self.match_id})
 
 
 def get_jobs_name(match_id):
@@ -0,0 +1,166 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import logging
+
+from db_manager import find_match, get_sport_type_info
+
+logger = logging.getLogger(__name__)
+
+ROSTER_EDIT_DELAY = 2  # seconds, roster changes in this window are merged in a single edit
+ROSTER_MESSAGES = {}  # match_id -> (chat_id, message_id) of the live roster message
+
+
+def create_roster_keyboard(match_id):
+    '''Builds the Join/Leave inline keyboard attached to a roster message.'''
+
+    keyboard = [[
+        InlineKeyboardButton('Join', callback_data=f'join:{match_id}'),
+        InlineKeyboardButton('Leave', callback_data=f'leave:{match_id}')
+    ]]
+
+    return InlineKeyboardMarkup(keyboard)
+
+
+def create_roster_text(match):
+    '''Produces the text of the roster message of a match.'''
+
+    info = match.create_info_message()
+    maximum_number_of_players = get_sport_type_info(match.sport)[1]
+    joined = f'Joined: {len(match.players_list)}/{maximum_number_of_players}'
+
+    return f'{info}\n{joined}'
+
+
+def bind_roster(match_id, chat_id, message_id):
+    '''Sets the given message as the live roster of the match.'''
+
+    ROSTER_MESSAGES[str(match_id)] = (chat_id, message_id)
+
+
+def has_roster(match_id):
+    '''Checks whether the match has a live roster message.'''
+
+    return str(match_id) in ROSTER_MESSAGES
+
+
+def is_live_roster(match_id, chat_id, message_id):
+    '''Checks whether the given message is the live roster of the match.'''
+
+    return ROSTER_MESSAGES.get(str(match_id)) == (chat_id, message_id)
+
+
+def retire_message(context, chat_id, message_id, text=None):
+    '''Removes the buttons of a roster message, replacing its text when given.'''
+
+    try:
+        if text:
+            context.bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
+        else:
+            context.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
+
+    except BadRequest as error:
+        logger.debug('Roster message %s not retired: %s', message_id, error, extra={'chat_id': chat_id})
+
+
+def post_roster(context, chat_id, match, header=None):
+    '''Sends a new roster message and makes it the live one for the match, the old one loses its buttons.'''
+
+    text = create_roster_text(match)
+
+    if header:  # shown only until the first edit of the roster
+        text = f'{header}\n{text}'
+
+    message = context.bot.send_message(
+        chat_id=chat_id,
+        text=text,
+        reply_markup=create_roster_keyboard(match.match_id)
+    )
+    previous = ROSTER_MESSAGES.get(str(match.match_id))  # kept live until the new message is sent
+    bind_roster(match.match_id, chat_id, message.message_id)
+
+    if previous:
+        retire_message(context, *previous)
+
+
+def schedule_roster_update(context, match_id):
+    '''Schedules an edit of the roster, changes within ROSTER_EDIT_DELAY share the same edit.'''
+
+    if not has_roster(match_id):
+        return
+
+    job_name = get_roster_job_name(match_id)
+
+    if context.job_queue.get_jobs_by_name(job_name):
+        logger.debug(
+            'Roster update for match %s already scheduled', match_id,
+            extra={'match_id': match_id, 'sample': 'roster_debounce'}
+        )
+        return
+
+    context.job_queue.run_once(
+        refresh_roster,
+        when=ROSTER_EDIT_DELAY,
+        context=str(match_id),
+        name=job_name
+    )
+
+
+def refresh_roster(context):
+    '''Edits the live roster message with the current state of the match.'''
+
+    match_id = context.job.context
+
+    if not has_roster(match_id):
+        return
+
+    try:
+        match = find_match(match_id)[1]
+
+    except (FileNotFoundError, KeyError):
+        close_roster(context, match_id, f'Match {match_id} is no longer available')
+        return
+
+    chat_id, message_id = ROSTER_MESSAGES[match_id]
+
+    try:
+        context.bot.edit_message_text(
+            text=create_roster_text(match),
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=create_roster_keyboard(match_id)
+        )
+
+    except BadRequest as error:
+
+        if 'not modified' in error.message.lower():  # nothing changed since the last edit
+            logger.debug('Roster of match %s not edited: %s', match_id, error, extra={'chat_id': chat_id, 'match_id': match_id})
+            return
+
+        # e.g. the message was deleted, /join and /leave go back to text replies
+        ROSTER_MESSAGES.pop(match_id, None)
+        logger.warning('Roster of match %s dropped: %s', match_id, error, extra={'chat_id': chat_id, 'match_id': match_id})
+
+
+def close_roster(context, match_id, text):
+    '''Replaces the roster of a match that no longer exists and removes its buttons.'''
+
+    roster = ROSTER_MESSAGES.pop(str(match_id), None)
+
+    if roster is None:
+        return
+
+    chat_id, message_id = roster
+
+    try:
+        context.bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
+    except BadRequest as error:
+        logger.warning('Roster of match %s could not be closed: %s', match_id, error, extra={'chat_id': chat_id, 'match_id': match_id})
+
+
+def get_roster_job_name(match_id):
+    '''Retrieves the name of the debounced roster edit job.'''
+
+    return f'{match_id}_roster_edit'
@@ -1,13 +1,15 @@
 from exceptions import DatabaseNotFoundError, MatchNotFoundError, UnauthorizedUserError
 from db_manager import find_match
+from player_names import PLAYER_NAMES
 
 
 def get_message_info(update):
     '''Retrieves the relevant information from the message.'''
 
     chat_id = update.effective_chat.id
-    user_id = update.message.from_user.id
-    return chat_id, user_id
+    user = update.message.from_user
+    PLAYER_NAMES.remember(user)  # names come for free with every command
+    return chat_id, user.id
 
 
 def get_match_in_db(context, match_id, chat_id):